@@ -1,11 +1,15 @@
 import os
+import random
 import shutil
-import subprocess
+import asyncio
+import logging
 
 import httpx
 from dotenv import load_dotenv
+from selectolax.lexbor import LexborHTMLParser
 
 
+logger = logging.getLogger()
 load_dotenv()
 BASE_URL = 'https://bioenergetic.forum/'
 HEADERS = {'Content-Type': 'application/json'}
@@ -15,7 +19,9 @@ CREDENTIALS = {
 }
 UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:53.0) Gecko/20100101 Firefox/53.0'
 URLS_FILE = 'urls.txt'
-WAIT_TIME = 10
+ARCHIVE_DIR = 'bioenergetic.forum'
+MAX_CONNECTIONS = 4
+WAIT_TIME = (0.2, 0.5)  # seconds, random pause after each request
 
 
 def get_tids() -> None:
@@ -35,26 +41,116 @@ def get_tids() -> None:
             f.write('\n'.join([f'{BASE_URL}topic/{tid}' for tid in tids]))
 
 
-def archive() -> None:
-    cmd = [
-        'wget',
-        '--recursive',
-        '--page-requisites',
-        '--content-disposition',
-        '--adjust-extension',
-        '--convert-links',
-        '--restrict-file-names=unix',
-        '--no-parent',
-        '--domains=bioenergetic.forum',
-        f'-U "{UA}"',
-        f'--wait={WAIT_TIME}',
-        f'--input-file={URLS_FILE}',
+def is_html(response: httpx.Response) -> bool:
+    return response.headers.get('Content-Type', '').startswith('text/html')
+
+
+def is_forum_url(url: httpx.URL) -> bool:
+    domain = httpx.URL(BASE_URL).host
+    return url.host == domain or url.host.endswith('.'+domain)
+
+
+def safe_segment(segment: str) -> str:
+    """
+    Escapes control characters in a path segment like wget's
+    --restrict-file-names=unix does.
+    """
+    return ''.join(
+        '%%%02X' % ord(char) if ord(char) < 32 or 128 <= ord(char) < 160 else char
+        for char in segment
+    )
+
+
+def url_to_path(response: httpx.Response) -> str:
+    """
+    Returns the file in ARCHIVE_DIR the response is saved to, mirroring the
+    URL path like wget does (with --adjust-extension for HTML pages).
+    Raises ValueError for URLs off the forum's domain (e.g. after a redirect)
+    and for paths that would leave ARCHIVE_DIR.
+    """
+    if not is_forum_url(response.url):
+        raise ValueError(f'{response.url} is not on {httpx.URL(BASE_URL).host}')
+    # the path is already percent-decoded, so it may hold '..' segments
+    segments = [safe_segment(segment) for segment in response.url.path.split('/') if segment]
+    path = os.path.normpath(os.path.join(ARCHIVE_DIR, *segments or ['index']))
+    if path == ARCHIVE_DIR or os.path.commonpath([path, ARCHIVE_DIR]) != ARCHIVE_DIR:
+        raise ValueError(f'{response.url} is outside of {ARCHIVE_DIR}')
+    if is_html(response) and not path.endswith('.html'):
+        path += '.html'
+    return path
+
+
+def page_requisites(response: httpx.Response) -> set[str]:
+    """
+    Returns absolute URLs of the images, scripts and stylesheets the page
+    needs, limited to the forum's domain.
+    """
+    tree = LexborHTMLParser(response.text)
+    urls = [node.attributes.get('src') for node in tree.css('img[src], script[src]')]
+    urls += [
+        node.attributes.get('href') for node in tree.css('link[href]')
+        if {'stylesheet', 'icon'} & set((node.attributes.get('rel') or '').split())
     ]
-    subprocess.run(cmd)
+    requisites = set()
+    for url in urls:
+        # attributes without a value, e.g. <img src>
+        if not url:
+            continue
+        try:
+            url = response.url.join(url)
+        except (httpx.InvalidURL, TypeError):
+            continue
+        if is_forum_url(url):
+            requisites.add(str(url.copy_with(fragment=None)))
+    return requisites
+
+
+async def save(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str) -> httpx.Response | None:
+    """
+    Fetches url and saves it to its file in ARCHIVE_DIR. Errors are logged and
+    skipped like wget does, the response is returned only on success.
+    """
+    try:
+        async with semaphore:
+            response = await client.get(url)
+            # stay polite without idling a fixed time between all requests
+            await asyncio.sleep(random.uniform(*WAIT_TIME))
+        if not response.is_success:
+            logger.error(f'Archive {url} ERROR: {response.status_code}.')
+            return None
+        path = url_to_path(response)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(response.content)
+    except (httpx.HTTPError, httpx.InvalidURL, OSError, ValueError) as e:
+        logger.error(f'Archive {url} ERROR: {e}.')
+        return None
+    return response
+
+
+async def archive() -> None:
+    """
+    Saves every page in URLS_FILE, and then their page requisites, to ARCHIVE_DIR
+    over at most MAX_CONNECTIONS pooled connections.
+    """
+    with open(URLS_FILE) as f:
+        urls = f.read().split()
+    semaphore = asyncio.Semaphore(MAX_CONNECTIONS)
+    async with httpx.AsyncClient(
+        headers={'User-Agent': UA},
+        http2=True,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS),
+    ) as client:
+        pages = await asyncio.gather(*[save(client, semaphore, url) for url in urls])
+        requisites = set()
+        for page in pages:
+            if page is not None and is_html(page):
+                requisites |= page_requisites(page)
+        await asyncio.gather(*[save(client, semaphore, url) for url in requisites])
 
 
 if __name__ == '__main__':
     get_tids()
-    archive()
-    shutil.make_archive('bioenergetic.forum', 'zip', 'bioenergetic.forum')
-
+    asyncio.run(archive())
+    shutil.make_archive(ARCHIVE_DIR, 'zip', ARCHIVE_DIR)
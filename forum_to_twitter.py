@@ -1,32 +1,130 @@
 import os
 import re
+import sys
 import enum
-import json
+import asyncio
 import logging
+import itertools
 from datetime import datetime
+from functools import lru_cache, cached_property
 from dataclasses import dataclass
+from collections.abc import Iterator
 
 import httpx
-import numpy as np
+import orjson
+import ahocorasick
 from dotenv import load_dotenv
-from more_itertools import flatten
 from better_profanity import profanity
-from selectolax.parser import HTMLParser
+from better_profanity.constants import ALLOWED_CHARACTERS
+from selectolax.lexbor import LexborHTMLParser
 
 
 logger = logging.getLogger()
 load_dotenv()
-profanity.load_censor_words()
+
+_MENTION_RE = re.compile(r'@\w+')
+_NONWORD_RE = re.compile(r'[^\w]')
+# words as better_profanity splits them
+_CENSOR_WORD_RE = re.compile('[%s]+' % ''.join(re.escape(char) for char in sorted(ALLOWED_CHARACTERS)))
+# better_profanity joins a word with at most this many following words
+_MAX_JOINED_WORDS = profanity.MAX_NUMBER_COMBINATIONS + 1
+
+
+def _build_censor_automaton() -> ahocorasick.Automaton:
+    """
+    Returns an automaton matching every spelling of the censor words that
+    profanity.CHARS_MAPPING allows, valued with the spelling's length.
+    """
+    automaton = ahocorasick.Automaton()
+    for word in map(str, profanity.CENSOR_WORDSET):
+        options = [profanity.CHARS_MAPPING.get(char, (char,)) for char in word]
+        for spelling in itertools.product(*options):
+            automaton.add_word(''.join(spelling), len(word))
+    automaton.make_automaton()
+    return automaton
+
+
+_CENSOR_AUTOMATON = _build_censor_automaton()
+
+
+def _censor_hits(text: str, words: list[tuple[int, int]]) -> Iterator[tuple[int, int]]:
+    """
+    Yields (first, last) indices of the words forming a censor word, either
+    together with the separators between them or joined without them.
+    """
+    lower = text.lower()
+    if len(lower) != len(text):
+        # lower() changes the length of a few characters (e.g. 'İ'), keep those
+        # as they are so offsets still line up; they can't be in a censor word
+        lower = ''.join(char if len(char.lower()) != 1 else char.lower() for char in text)
+    starts = {start: i for i, (start, _) in enumerate(words)}
+    ends = {end: i for i, (_, end) in enumerate(words)}
+    for end, length in _CENSOR_AUTOMATON.iter(lower):
+        first, last = starts.get(end+1-length), ends.get(end+1)
+        if first is not None and last is not None:
+            yield first, last
+
+    # words broken up by separators, e.g. 'f-u-c-k'
+    joined_words = [text[start:end].lower() for start, end in words]
+    starts, ends, offset = {}, {}, 0
+    for i, word in enumerate(joined_words):
+        starts[offset] = i
+        offset += len(word)
+        ends[offset] = i
+    for end, length in _CENSOR_AUTOMATON.iter(''.join(joined_words)):
+        first, last = starts.get(end+1-length), ends.get(end+1)
+        if first is not None and last is not None and last-first < _MAX_JOINED_WORDS:
+            yield first, last
+
+
+# the same usernames recur in almost every post of a topic
+@lru_cache(maxsize=4096)
+def _censor(text: str) -> str:
+    """
+    Replaces censor words with '****' like profanity.censor does, but finds
+    them in a single pass of _CENSOR_AUTOMATON over the text instead of
+    comparing every word with the whole wordlist.
+
+    >>> _censor('İstanbul 2 g*r1$ 1 cvp')
+    'İstanbul ****'
+    """
+    words = [m.span() for m in _CENSOR_WORD_RE.finditer(text)]
+    hits = {}
+    for first, last in _censor_hits(text, words):
+        hits.setdefault(first, set()).add(last)
+    if not hits:
+        return text
+
+    censored = []
+    i = censored_end = 0
+    while i < len(words):
+        lasts = hits.get(i, ())
+        # like better_profanity, prefer the shortest match joining several words,
+        # which never joins a one letter word ending the text
+        joins = [last for last in lasts if last > i and words[last][0] < len(text)-1]
+        if joins:
+            last = min(joins)
+        elif i in lasts:
+            last = i
+        else:
+            i += 1
+            continue
+        censored += [text[censored_end:words[i][0]], '****']
+        censored_end = words[last][1]
+        i = last+1
+    censored.append(text[censored_end:])
+    return ''.join(censored)
 
 
 def remove_html(html: str) -> str:
-    tree = HTMLParser(html)
-    return tree.text().replace('\n', ' ')
+    tree = LexborHTMLParser(html)
+    return tree.body.text().replace('\n', ' ')
 
 
+@lru_cache(maxsize=4096)
 def profanity_only(text: str) -> bool:
-    text = re.sub(r'@\w+', '', text)
-    text = re.sub(r'[^\w]', '', text)
+    text = _MENTION_RE.sub('', text)
+    text = _NONWORD_RE.sub('', text)
     return len(text) == 0
 
 
@@ -56,22 +154,30 @@ class Post:
     replies_to: str | None
     date: datetime
     content: str
-    text: str | None = None
 
-    def __post_init__(self) -> None:
-        self.username = profanity.censor(self.username)
-        if profanity_only(self.username):
-            self.username = str(self.uid)
-        if self.replies_to is not None:
-            self.replies_to = profanity.censor(self.replies_to)
-        self.text = profanity.censor(remove_html(self.content))
-        self.content = profanity.censor(self.content)
+    # censored fields are lazy, posts dropped by postprocess_posts never compute them
+    @cached_property
+    def censored_username(self) -> str:
+        username = _censor(self.username)
+        if profanity_only(username):
+            return str(self.uid)
+        return username
+
+    @cached_property
+    def censored_replies_to(self) -> str | None:
+        if self.replies_to is None:
+            return None
+        return _censor(self.replies_to)
+
+    @cached_property
+    def text(self) -> str:
+        return _censor(remove_html(self.content))
 
     def to_tweet(self) -> str:
         date = self.date.strftime('%Y-%m-%d')
-        tweet = f'[{date}] {self.username}'
-        if self.replies_to is not None:
-            tweet += f' to {self.replies_to}'
+        tweet = f'[{date}] {self.censored_username}'
+        if self.censored_replies_to is not None:
+            tweet += f' to {self.censored_replies_to}'
         tweet += ': '
         tweet += self.text
         return tweet
@@ -87,16 +193,19 @@ class Topic:
     posts: list[Post]
 
     def __post_init__(self) -> None:
-        self.title = profanity.censor(self.title)
-        self.author = profanity.censor(self.author)
+        self.title = _censor(self.title)
+        self.author = _censor(self.author)
         if profanity_only(self.author):
             self.author = str(self.author_uid)
 
 
 CATEGORY_BLACKLIST = [Categories.JUNKYARD]
+# the API reports categories by their cid
+_BLACKLIST_CIDS = frozenset(category.value for category in CATEGORY_BLACKLIST)
 PERIOD = Periods.ONE_MONTH
 BASE_URL = 'https://bioenergetic.forum/api/'
 BOT_USERNAME = 'brad'
+BOT_TAG = sys.intern(f'@{BOT_USERNAME}')
 IS_TWITTER_PREMIUM = False
 TWITTER_CHAR_LIMIT = 4_000 if IS_TWITTER_PREMIUM else 280
 HEADERS = {'Content-Type': 'application/json'}
@@ -104,9 +213,23 @@ CREDENTIALS = {
   'username': os.environ['FORUM_USERNAME'],
   'password': os.environ['FORUM_PASSWORD'],
 }
+CLIENT = httpx.AsyncClient(
+    base_url=BASE_URL,
+    headers=HEADERS,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+)
+
+
+async def login() -> None:
+    """
+    Creates a session on the shared CLIENT; must be called once before any other request.
+    """
+    response = await CLIENT.post('v3/utilities/login', json=CREDENTIALS)
+    response.raise_for_status()
 
 
-def get_recent_mentions(page: int = None) -> dict:
+async def get_recent_mentions(page: int = None) -> dict:
     """
     Searches for the mentions of the bot newer than PERIOD.
 
@@ -118,21 +241,13 @@ def get_recent_mentions(page: int = None) -> dict:
     'pagination'    : dict with pages' information
     'multiplePages' : boolean value indicating if result is paginated
     """
-    url = BASE_URL + f'search?in=posts&term=%40{BOT_USERNAME}&matchWords=all&by=&categories=&searchChildren=false&hasTags=&replies=&repliesFilter=atleast&timeFilter=newer&timeRange={PERIOD.value}&sortBy=timestamp&sortDirection=desc&showAs=posts'
+    url = f'search?in=posts&term=%40{BOT_USERNAME}&matchWords=all&by=&categories=&searchChildren=false&hasTags=&replies=&repliesFilter=atleast&timeFilter=newer&timeRange={PERIOD.value}&sortBy=timestamp&sortDirection=desc&showAs=posts'
     if page is not None:
         url += f'&page={page}'
     try:
-
-        with httpx.Client() as client:
-            # create session
-            client.post(
-                BASE_URL+'v3/utilities/login', 
-                headers=HEADERS,
-                json=CREDENTIALS
-            )
-            response = client.get(url)
-            response.raise_for_status()
-            data = response.json()
+        response = await CLIENT.get(url)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
         logger.info(f'Mentions {"" if page is None else "Page "+str(page)+" "}OK: {response.status_code} ({data["time"]}s).')
     except httpx.HTTPError as e:
         logger.error(f'Mentions {"" if page is None else "Page "+str(page)+" "}ERROR: {response.status_code}.')
@@ -142,53 +257,49 @@ def get_recent_mentions(page: int = None) -> dict:
     return data
 
 
-def extract_topics(mentions: dict) -> list[str]:
+async def extract_topics(mentions: dict) -> list[str]:
     """
     Returns unique topic slugs that are not in CATEGORY_BLACKLIST 
-    for all mentions provided.
+    for all mentions provided. The remaining pages are fetched concurrently.
     """
+    topics = [post['topic'] for post in mentions['posts']]
     if mentions['multiplePages']:
-        topics = []
-        for page in range(2, mentions['pageCount']+1):
-            next_mentions = get_recent_mentions(page)
-            topics += [post['topic'] for post in next_mentions['posts']]
-    else:
-        topics = [post['topic'] for post in mentions['posts']]
+        next_mentions = await asyncio.gather(
+            *[get_recent_mentions(page) for page in range(2, mentions['pageCount']+1)]
+        )
+        topics += [post['topic'] for page in next_mentions for post in page['posts']]
 
-    topic_slugs = [topic['slug'] for topic in topics if topic['cid'] not in CATEGORY_BLACKLIST]
-    return list(set(topic_slugs))
+    # dict keeps the slugs in the order they were mentioned
+    return list(dict.fromkeys(topic['slug'] for topic in topics if topic['cid'] not in _BLACKLIST_CIDS))
 
 
 def postprocess_posts(posts: list[Post]) -> list[Post]:
     # remove posts added after taggin the bot
-    tagging_posts = np.where([f'@{BOT_USERNAME}' in post.content for post in posts])[0]
-    if len(tagging_posts) == 0:
-        # temporary testing fix
-        tagging_posts = [999]
-    posts = [post for i, post in enumerate(posts) if i not in tagging_posts and i < max(tagging_posts)]
-    # remove posts by banned users 
-    posts = [post for post in posts if not post.is_banned]
-    # remove posts containing only profanity
-    posts = [post for post in posts if not profanity_only(post.text)]
-    return posts
-
-
-def compile_posts_into_topic(topic_slug: str) -> Topic:
+    cutoff = max(
+        (i for i, post in enumerate(posts) if BOT_TAG in post.content),
+        default=999,  # temporary testing fix
+    )
+    return [
+        post for i, post in enumerate(posts)
+        if i < cutoff
+        # remove posts by banned users
+        and not post.is_banned
+        # remove the tagging posts themselves
+        and BOT_TAG not in post.content
+        # remove posts containing only profanity
+        and not profanity_only(post.text)
+    ]
+
+
+async def compile_posts_into_topic(topic_slug: str) -> Topic:
     """
     Given topic slug, get all posts in the topic.
     """
-    def get_page(url: str, page_num: int) -> dict:
+    async def get_page(url: str, page_num: int) -> dict:
         try:
-            with httpx.Client() as client:
-                # create session
-                client.post(
-                    BASE_URL+'v3/utilities/login', 
-                    headers=HEADERS,
-                    json=CREDENTIALS
-                )
-                response = client.get(url)
-                response.raise_for_status()
-                data = response.json()
+            response = await CLIENT.get(url)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
             logger.info(f'Topic {topic_slug} Page {page_num} OK: {response.status_code}.')
         except httpx.HTTPError as e:
             logger.error(f'Topic {topic_slug} Page {page_num} ERROR: {response.status_code}.')
@@ -198,30 +309,35 @@ def compile_posts_into_topic(topic_slug: str) -> Topic:
     
 
     def extract_posts(page: dict) -> list[Post]:
+        # the timestamp belongs to the page, parse it once for all of its posts
+        date = datetime.fromisoformat(page['timestampISO'].rstrip('Z'))
         return [
             Post(
                 uid=post['uid'],
                 username=post['user']['username'],
                 is_banned=post['user']['banned'],
                 replies_to=post.get('parent', {}).get('username'),
-                date=datetime.strptime(page['timestampISO'], '%Y-%m-%dT%H:%M:%S.%fZ'),
+                date=date,
                 content=post['content'],
             ) for post in page['posts']
         ]
 
     # get the first page
-    url = BASE_URL+'topic/'+topic_slug
-    page = get_page(url, 1) 
+    url = 'topic/'+topic_slug
+    page = await get_page(url, 1)
     page_count = page['pagination']['pageCount']
     id = page['tid']
     title = page['title']
     author = page['author']['username']
     author_uid = page['author']['uid']
-    date = datetime.strptime(page['timestampISO'], '%Y-%m-%dT%H:%M:%S.%fZ')
+    date = datetime.fromisoformat(page['timestampISO'].rstrip('Z'))
     posts = extract_posts(page)
 
-    for i in range(1, page_count+1):
-        page = get_page(url+f'?page={i}', i)
+    # the rest of the pages are independent of each other
+    next_pages = await asyncio.gather(
+        *[get_page(url+f'?page={i}', i) for i in range(2, page_count+1)]
+    )
+    for page in next_pages:
         posts += extract_posts(page)
 
     posts = postprocess_posts(posts)
@@ -233,14 +349,28 @@ def split_text_on_words(text: str, char_limit: int = TWITTER_CHAR_LIMIT) -> list
     if len(text) <= char_limit:
         return [text.strip(' \n')]
     
-    lines = [line.strip(' \n') for line in re.findall(r'.{%d}' % char_limit, text)]
-
-    ending_idx = text.rfind(lines[-1])+len(lines[-1])
-    maybe_last_line = text[ending_idx:].strip(' \n')
-    if maybe_last_line:
-        lines.append(maybe_last_line)
-
-    return lines
+    lines = []
+    line, line_len = [], -1  # -1 makes up for the space before the first word
+    for word in text.split(' '):
+        if not word:
+            continue
+        if line_len+1+len(word) > char_limit:
+            lines.append(' '.join(line))
+            line, line_len = [], -1
+        # a word longer than a whole tweet has to be cut
+        while len(word) > char_limit:
+            lines.append(word[:char_limit])
+            word = word[char_limit:]
+        line.append(word)
+        line_len += 1+len(word)
+    lines.append(' '.join(line))
+
+    return [line for line in (line.strip(' \n') for line in lines) if line]
+
+
+def _iter_post_tweets(posts: list[Post], char_limit: int = TWITTER_CHAR_LIMIT) -> Iterator[str]:
+    for post in posts:
+        yield from split_text_on_words(post.to_tweet(), char_limit)
 
 
 def topic_to_thread(topic: Topic) -> list[str]:
@@ -248,18 +378,23 @@ def topic_to_thread(topic: Topic) -> list[str]:
     title = f'{topic.title} by {topic.author} ({date})'
     title_tweets = split_text_on_words(title)
 
-    post_tweets = list(flatten([split_text_on_words(post.to_tweet()) for post in topic.posts]))
-    return title_tweets + post_tweets
+    return list(itertools.chain(title_tweets, _iter_post_tweets(topic.posts)))
 
 
-if __name__ == '__main__':
-    mentions = get_recent_mentions()
-    topic_slugs = extract_topics(mentions)
+async def main() -> None:
+    await login()
+    mentions = await get_recent_mentions()
+    topic_slugs = await extract_topics(mentions)
     threads = []
     for topic_slug in topic_slugs:
-        topic = compile_posts_into_topic(topic_slug)
+        topic = await compile_posts_into_topic(topic_slug)
         thread = topic_to_thread(topic)
         threads.append(thread)
-        print(json.dumps(thread, indent=2))
+        print(orjson.dumps(thread, option=orjson.OPT_INDENT_2).decode())
         break
+    await CLIENT.aclose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
 
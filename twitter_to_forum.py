@@ -1,11 +1,10 @@
 import os
 import time
 import logging
-from datetime import datetime
+from email.utils import parsedate_to_datetime
 
 import httpx
 import tweepy
-import pandas as pd
 from dotenv import load_dotenv
 
 
@@ -22,6 +21,12 @@ CREDENTIALS = {
   'username': os.environ['FORUM_USERNAME'],
   'password': os.environ['FORUM_PASSWORD'],
 }
+CLIENT = httpx.Client(
+    base_url=BASE_URL,
+    headers=HEADERS,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+)
 
 
 class Tweet:
@@ -34,7 +39,7 @@ class Tweet:
         self.text = status_dict.get('full_text', status_dict.get('text'))
         if self.text is None:
             raise ValueError(f'text can not be None: {status_dict = }')
-        self.created_at = datetime.strptime(status_dict['created_at'], '%a %b %d %H:%M:%S %z %Y')
+        self.created_at = parsedate_to_datetime(status_dict['created_at'])
         self.in_reply_to_status_id = status_dict['in_reply_to_status_id']
         self.in_reply_to_user_id = status_dict['in_reply_to_user_id']
         self.in_reply_to_screen_name = status_dict['in_reply_to_screen_name']
@@ -54,47 +59,40 @@ class Tweet:
         return f'{header}:\n{self.text}{footer}'
 
 
+def login() -> None:
+    """
+    Creates a session on the shared CLIENT; must be called once before posting.
+    """
+    response = CLIENT.post('utilities/login', json=CREDENTIALS)
+    response.raise_for_status()
+
+
 def post_forum(posts: list[dict]) -> bool:
     posts = [Tweet(post) for post in posts]
-    with httpx.Client() as client:
-        # create session
-        client.post(
-            BASE_URL+'utilities/login', 
-            headers=HEADERS,
-            json=CREDENTIALS
-        )
-        # create a new topic
-        first_post = str(posts[0])
-        title = first_post[:70]
-        if len(first_post) < 70:
-            title += '...'
-        create_payload = {
-            'cid': CID,
-            'title': title,
-            'content': first_post,
-            'timestamp': time.time_ns(),
-            'tags': [],  # some NLP to extract keywords?
+    # create a new topic
+    first_post = str(posts[0])
+    title = first_post[:70]
+    if len(first_post) < 70:
+        title += '...'
+    create_payload = {
+        'cid': CID,
+        'title': title,
+        'content': first_post,
+        'timestamp': time.time_ns(),
+        'tags': [],  # some NLP to extract keywords?
+    }
+    response = CLIENT.post('topics/', data=create_payload)
+    response.raise_for_status()  # how to handle errors?
+    tid = response.json()['response']['tid']
+    # post all other tweets one by one, the forum timestamps replies on arrival
+    for post in posts[1:]:
+        post = str(post)
+        post_payload = {
+            'content': post,
+            'toPid': 0,  # ???
         }
-        response = client.post(
-            BASE_URL+'topics/',
-            headers=HEADERS,
-            data=create_payload,
-        )
-        response.raise_for_status()  # how to handle errors?
-        tid = response.json()['response']['tid']
-        # post all other tweets
-        for post in posts[1:]:
-            post = str(post)
-            post_payload = {
-                'content': post,
-                'toPid': 0,  # ???
-            }
-            response = client.post(
-                BASE_URL+f'topics/{tid}',
-                headers=HEADERS,
-                data=post_payload,
-            )
-            response.raise_for_status()
+        response = CLIENT.post(f'topics/{tid}', data=post_payload)
+        response.raise_for_status()
 
 
 
@@ -123,6 +121,12 @@ def unroll_thread(api: tweepy.API, comment_status: dict) -> tuple[str, str, list
 
 class MyStreamListener(tweepy.StreamingClient):
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # ids of the tweets already re-posted, kept in sync with IDS_FILE
+        with open(IDS_FILE) as f:
+            self.__seen_ids = {int(line.split(',')[0]) for line in f if line.strip()}
+
     def on_tweet(self, tweet: dict) -> None:
         if not self.__is_valid_comment(tweet):
             return
@@ -142,13 +146,12 @@ class MyStreamListener(tweepy.StreamingClient):
         pass
 
     def __is_valid_comment(self, tweet: dict) -> bool:
-        id_ = tweet['id']
-        df = pd.read_csv(IDS_FILE, names=['id'])
-        return df.loc[df['id'] == id_].empty
+        return tweet['id'] not in self.__seen_ids
 
     def __save_tweet_id(self, tweet_id: int) -> None:
         with open(IDS_FILE, 'a') as f:
             f.write(f'{tweet_id},\n')
+        self.__seen_ids.add(tweet_id)
 
 
 
@@ -157,6 +160,8 @@ def main() -> None:
         with open(IDS_FILE, 'w') as _:
             pass
 
+    login()
+
     CONSUMER_KEY = os.environ['API_KEY']
     CONSUMER_SECRET = os.environ['API_KEY_SECRET']
     BEARER_TOKEN = os.environ['BEARER_TOKEN']